@@ -4,16 +4,25 @@ as tools, resources, and prompts for Cursor, Claude Code, and Windsurf.
 """
 
 import os
-import json
+import hashlib
 import logging
 import re
+import math
+import random
+import time
 import asyncio
+from contextlib import asynccontextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from urllib.parse import urlparse
+from typing import Any, Callable, Literal
 
 import httpx
+import orjson
 from dotenv import load_dotenv
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -23,14 +32,62 @@ load_dotenv()
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
-LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-4.1-mini")
+SYMBOLS_MCP_URL = os.getenv("SYMBOLS_MCP_URL", "")
+DEFAULT_MODEL = "openai/gpt-4.1-mini"
+DEFAULT_MAX_TOKENS = 4000
+DEFAULT_TEMPERATURE = 0.7
+LLM_MODEL = os.getenv("LLM_MODEL", DEFAULT_MODEL)
 SKILLS_DIR = os.getenv("SYMBOLS_SKILLS_DIR", str(Path(__file__).resolve().parent / "skills"))
 
+# Railway production serves the FastAPI app over HTTP; anything else runs stdio
+IS_RAILWAY = os.getenv("RAILWAY_ENVIRONMENT") == "production"
+
+OPENROUTER_CHAT_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_HEADERS = {
+    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+    "Content-Type": "application/json",
+    "HTTP-Referer": "https://github.com/baronsilver/symbols-mcp-server",
+}
+
+# Where the tools send completions: the hosted proxy when configured,
+# otherwise OpenRouter directly. _CALL_URL is None when neither is set.
+if SYMBOLS_MCP_URL:
+    _CALL_URL = f"{SYMBOLS_MCP_URL}/api/chat"
+    _CALL_HEADERS = {"Content-Type": "application/json"}
+    _CALL_HOST = urlparse(SYMBOLS_MCP_URL).netloc or SYMBOLS_MCP_URL
+elif OPENROUTER_API_KEY:
+    _CALL_URL = OPENROUTER_CHAT_URL
+    _CALL_HEADERS = OPENROUTER_HEADERS
+    _CALL_HOST = "openrouter.ai"
+else:
+    _CALL_URL = None
+
+# Exact-match cache for deterministic (temperature 0) /api/chat responses
+PROXY_CACHE_SIZE = int(os.getenv("PROXY_CACHE_SIZE", "10000"))
+PROXY_CACHE_TTL = float(os.getenv("PROXY_CACHE_TTL", "3600"))
+
+# Per-client sliding-window limit on /api/chat (0 disables)
+PROXY_RATE_LIMIT = int(os.getenv("PROXY_RATE_LIMIT", "60"))
+PROXY_RATE_WINDOW = float(os.getenv("PROXY_RATE_WINDOW", "60"))
+
+# Cap on concurrent /api/chat calls in flight to OpenRouter
+MAX_CONCURRENT_UPSTREAM = int(os.getenv("MAX_CONCURRENT_UPSTREAM", "64"))
+
+# Cap on concurrent OpenRouter calls made by the MCP tools in this process
+SYMBOLS_MCP_CONCURRENCY = int(os.getenv("SYMBOLS_MCP_CONCURRENCY", "20"))
+
+# Reuse of explain/review answers for identical prompts (0 disables)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+
+# Context window of LLM_MODEL; requested completions are capped to fit in it
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "128000"))
+
 
 def _fetch_remote_config() -> None:
     """Fetch Supabase credentials from the proxy server when not set locally."""
     global SUPABASE_URL, SUPABASE_KEY
-    proxy_url = os.getenv("SYMBOLS_MCP_URL")
+    proxy_url = SYMBOLS_MCP_URL
     if not proxy_url or (SUPABASE_URL and SUPABASE_KEY):
         return
     try:
@@ -50,6 +107,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("symbols-mcp")
 
 
+@lru_cache(maxsize=1)
 def _load_agent_instructions() -> str:
     """Load the upfront AI agent instructions from AGENT_INSTRUCTIONS.md."""
     path = Path(SKILLS_DIR) / "AGENT_INSTRUCTIONS.md"
@@ -66,9 +124,19 @@ def _load_agent_instructions() -> str:
 # ---------------------------------------------------------------------------
 # MCP Server
 # ---------------------------------------------------------------------------
+@asynccontextmanager
+async def _mcp_lifespan(server: FastMCP):
+    """Warm the skills caches on start and close the shared upstream client on exit."""
+    warm_up = _start_skill_warm_up()
+    yield
+    warm_up.cancel()
+    await _close_http_client()
+
+
 mcp = FastMCP(
     "Symbols AI Assistant",
     instructions=_load_agent_instructions(),
+    lifespan=_mcp_lifespan,
 )
 
 # ---------------------------------------------------------------------------
@@ -77,105 +145,365 @@ mcp = FastMCP(
 SKILLS_PATH = Path(SKILLS_DIR)
 
 
+# Shared pooled client so repeated upstream calls reuse keep-alive connections.
+# HTTP/2 lets concurrent requests to the same host multiplex over one socket.
+_HTTP_CLIENT: httpx.AsyncClient | None = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled HTTP client, creating it on first use."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=200,
+                max_keepalive_connections=100,
+                keepalive_expiry=75.0,
+            ),
+            # Fail fast on an unreachable host; completions themselves can take a while
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+    return _HTTP_CLIENT
+
+
+async def _close_http_client() -> None:
+    """Close the shared HTTP client, releasing pooled connections."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
+
+
+_OPENROUTER_SEMAPHORE = asyncio.Semaphore(SYMBOLS_MCP_CONCURRENCY)
+
+
+class _TTLCache:
+    """Small in-process LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, object]] = OrderedDict()
+
+    def get(self, key: str) -> object | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: object) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+@lru_cache(maxsize=1)
+def _skill_files() -> tuple[Path, ...]:
+    """Markdown files in the skills directory, listed once per process."""
+    try:
+        with os.scandir(SKILLS_PATH) as entries:
+            return tuple(
+                Path(entry.path)
+                for entry in entries
+                if entry.name.endswith(".md") and not entry.name.startswith(".") and entry.is_file()
+            )
+    except FileNotFoundError:
+        return ()
+
+
+@lru_cache(maxsize=1)
+def _skill_paths() -> dict[str, Path]:
+    """Skills files keyed by file name, so lookups need no stat call."""
+    return {path.name: path for path in _skill_files()}
+
+
+@lru_cache(maxsize=32)
 def _read_skill(filename: str) -> str:
-    """Read a skill markdown file from the skills directory."""
-    path = SKILLS_PATH / filename
-    if path.exists():
+    """Read a skill markdown file from the skills directory (cached per process)."""
+    path = _skill_paths().get(filename)
+    if path is not None:
         return path.read_text(encoding="utf-8")
-    return f"Skill file '{filename}' not found at {path}"
+    return f"Skill file '{filename}' not found at {SKILLS_PATH / filename}"
 
 
-async def _call_openrouter(prompt: str, max_tokens: int = 4000) -> str:
-    """Call OpenRouter API for AI generation via proxy or direct.
+_RETRYABLE_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+def _backoff_delay(attempt: int, error: Exception | None) -> float:
+    """Seconds to wait before retry ``attempt``: 1s, 2s, 4s... capped at 8s, plus jitter.
 
-    Retries up to 3 times with exponential backoff on transient
-    network errors (DNS failures, connection resets, timeouts).
+    A Retry-After header on a 429 takes precedence when present.
     """
-    proxy_url = os.getenv("SYMBOLS_MCP_URL")
-    api_key = os.getenv("OPENROUTER_API_KEY")
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429:
+        try:
+            return min(float(error.response.headers["retry-after"]), 8.0)
+        except (KeyError, ValueError):
+            pass
+    return min(2.0 ** (attempt - 1), 8.0) + random.uniform(0, 0.5)
+
+
+# Report streamed generation progress to the MCP client every this many characters
+_PROGRESS_STEP = 1024
 
-    if not proxy_url and not api_key:
-        return "Error: Either SYMBOLS_MCP_URL or OPENROUTER_API_KEY must be set"
 
-    # Determine target host for diagnostics
-    if proxy_url:
-        from urllib.parse import urlparse
-        target_host = urlparse(proxy_url).netloc or proxy_url
+async def _collect_streamed_completion(response: httpx.Response, ctx: Context, reported: list[int]) -> str:
+    """Join the content deltas of an SSE chat completion, reporting progress as they arrive.
+
+    ``reported`` holds the last progress value sent and is shared across
+    retries, so a restarted stream stays silent until it passes that mark;
+    MCP requires progress to increase.
+    """
+    parts: list[str] = []
+    received = 0
+    async for line in response.aiter_lines():
+        # Skip keep-alive comments and blank separators between events
+        if not line.startswith("data: "):
+            continue
+        data = line[6:]
+        if data == "[DONE]":
+            break
+        chunk = orjson.loads(data)
+        if "error" in chunk:
+            error = chunk["error"]
+            message = error.get("message", error) if isinstance(error, dict) else error
+            raise RuntimeError(f"OpenRouter stream failed: {message}")
+        choices = chunk.get("choices")
+        delta = choices[0].get("delta", {}).get("content") if choices else None
+        if delta:
+            parts.append(delta)
+            received += len(delta)
+            if received - reported[0] >= _PROGRESS_STEP:
+                reported[0] = received
+                await ctx.report_progress(received, message=f"Received {received} characters")
+    return "".join(parts)
+
+
+# Conservative characters-per-token ratio for the markdown and code in prompts,
+# plus headroom for message framing the estimate does not see
+_CHARS_PER_TOKEN = 3
+_CONTEXT_MARGIN_TOKENS = 256
+
+
+def _completion_budget(prompt: str, system: str | None, max_tokens: int) -> int:
+    """Cap ``max_tokens`` so the estimated prompt plus completion fits LLM_CONTEXT_TOKENS.
+
+    Returns zero or less when the prompt alone does not fit.
+    """
+    prompt_chars = len(prompt) + (len(system) if system else 0)
+    prompt_tokens = -(-prompt_chars // _CHARS_PER_TOKEN)
+    return min(max_tokens, LLM_CONTEXT_TOKENS - prompt_tokens - _CONTEXT_MARGIN_TOKENS)
+
+
+def _chat_messages(model: str, prompt: str, system: str | None) -> list[dict[str, Any]]:
+    """Build the chat messages, with the shared context as a separate system message.
+
+    Keeping the large, stable context in its own leading message lets
+    providers reuse their prompt cache across tool calls; Anthropic models
+    need an explicit cache_control marker for that.
+    """
+    if system is None:
+        return [{"role": "user", "content": prompt}]
+    if model.startswith("anthropic/"):
+        system_content: Any = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
     else:
-        target_host = "openrouter.ai"
+        system_content = system
+    return [{"role": "system", "content": system_content}, {"role": "user", "content": prompt}]
+
+
+async def _call_openrouter(
+    prompt: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    ctx: Context | None = None,
+    system: str | None = None,
+) -> str:
+    """Call OpenRouter API for AI generation via proxy or direct.
+
+    ``system`` carries the static context shared between calls and
+    ``prompt`` the task-specific part. With an MCP ``ctx`` the completion is
+    streamed, so the client receives progress notifications while long
+    generations are still running.
+
+    Retries up to 3 times with jittered exponential backoff on transient
+    network errors (DNS failures, connection resets, timeouts) and on
+    retryable HTTP statuses (408, 409, 429, 5xx gateway errors).
+    """
+    if _CALL_URL is None:
+        return "Error: Either SYMBOLS_MCP_URL or OPENROUTER_API_KEY must be set"
+
+    max_tokens = _completion_budget(prompt, system, max_tokens)
+    if max_tokens <= 0:
+        return f"Error: Prompt is too long for the {LLM_CONTEXT_TOKENS}-token context of {LLM_MODEL}"
+
+    payload = {
+        "model": LLM_MODEL,
+        "messages": _chat_messages(LLM_MODEL, prompt, system),
+        "max_tokens": max_tokens,
+        "temperature": DEFAULT_TEMPERATURE,
+    }
+    if ctx is not None:
+        payload["stream"] = True
 
     max_retries = 4
     last_error: Exception | None = None
+    reported = [0]
 
     for attempt in range(max_retries):
         if attempt > 0:
-            wait = 3 * attempt  # 3s, 6s, 9s
-            logger.warning("Network error on attempt %d/%d, retrying in %ds: %s", attempt + 1, max_retries, wait, last_error)
+            wait = _backoff_delay(attempt, last_error)
+            logger.warning("Network error on attempt %d/%d, retrying in %.1fs: %s", attempt + 1, max_retries, wait, last_error)
             await asyncio.sleep(wait)
 
         try:
-            async with httpx.AsyncClient() as client:
-                if proxy_url:
-                    response = await client.post(
-                        f"{proxy_url}/api/chat",
-                        headers={"Content-Type": "application/json"},
-                        json={
-                            "model": os.getenv("LLM_MODEL", "openai/gpt-4.1-mini"),
-                            "messages": [{"role": "user", "content": prompt}],
-                            "max_tokens": max_tokens,
-                            "temperature": 0.7,
-                        },
-                        timeout=60.0,
-                    )
-                else:
-                    response = await client.post(
-                        "https://openrouter.ai/api/v1/chat/completions",
-                        headers={
-                            "Authorization": f"Bearer {api_key}",
-                            "Content-Type": "application/json",
-                            "HTTP-Referer": "https://github.com/baronsilver/symbols-mcp-server",
-                        },
-                        json={
-                            "model": os.getenv("LLM_MODEL", "openai/gpt-4.1-mini"),
-                            "messages": [{"role": "user", "content": prompt}],
-                            "max_tokens": max_tokens,
-                            "temperature": 0.7,
-                        },
-                        timeout=60.0,
-                    )
-                response.raise_for_status()
-                return response.json()["choices"][0]["message"]["content"]
-
-        except httpx.ConnectError as e:
+            client = _get_http_client()
+            async with _OPENROUTER_SEMAPHORE:
+                if ctx is None:
+                    response = await client.post(_CALL_URL, headers=_CALL_HEADERS, json=payload)
+                    response.raise_for_status()
+                    return orjson.loads(response.content)["choices"][0]["message"]["content"]
+                async with client.stream("POST", _CALL_URL, headers=_CALL_HEADERS, json=payload) as response:
+                    if response.is_error:
+                        await response.aread()
+                        response.raise_for_status()
+                    try:
+                        return await _collect_streamed_completion(response, ctx, reported)
+                    except RuntimeError as e:
+                        # An error event mid-stream; report it like other failed calls
+                        return f"Error: {e}"
+
+        except httpx.TransportError as e:
             last_error = e
             continue  # retry — includes DNS failures from proxy cold-starts
-        except (httpx.TimeoutException, httpx.RemoteProtocolError) as e:
-            last_error = e
-            continue
         except httpx.HTTPStatusError as e:
-            if e.response.status_code >= 500:
+            if e.response.status_code in _RETRYABLE_STATUSES:
                 last_error = e
                 continue
             raise
 
     return (
-        f"Error: Network request to '{target_host}' failed after {max_retries} attempts. "
+        f"Error: Network request to '{_CALL_HOST}' failed after {max_retries} attempts. "
         f"Last error: {last_error}"
     )
 
 
+async def _call_openrouter_many(
+    prompts: list[str],
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    system: str | None = None,
+) -> list[str]:
+    """Run several prompts concurrently, bounded by SYMBOLS_MCP_CONCURRENCY.
+
+    A prompt whose call raises gets an "Error: ..." result in its slot, so
+    one failure does not discard the others' completions.
+    """
+    results = await asyncio.gather(
+        *(_call_openrouter(p, max_tokens, system=system) for p in prompts),
+        return_exceptions=True,
+    )
+    completions = []
+    for result in results:
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result
+            result = f"Error: {result}"
+        completions.append(result)
+    return completions
+
+
+_LLM_CACHE = _TTLCache(LLM_CACHE_SIZE, LLM_CACHE_TTL)
+
+
+async def _call_openrouter_cached(
+    prompt: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    ctx: Context | None = None,
+    system: str | None = None,
+) -> str:
+    """``_call_openrouter`` that reuses a recent answer to the identical prompt.
+
+    Only for informational tools; generation tools stay uncached so that
+    re-running them still yields a fresh variant.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if system is not None:
+        digest.update(system.encode())
+    digest.update(b"\0")
+    digest.update(prompt.encode())
+    key = f"{LLM_MODEL}:{max_tokens}:{digest.hexdigest()}"
+    cached = _LLM_CACHE.get(key)
+    if cached is not None:
+        return cached
+    result = await _call_openrouter(prompt, max_tokens=max_tokens, ctx=ctx, system=system)
+    if not result.startswith("Error:"):
+        _LLM_CACHE.set(key, result)
+    return result
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=64)
+def _load_searchable_skill(path: Path, mtime_ns: int) -> tuple[str, list[str], list[str]]:
+    """Return (lowercased content, lines, lowercased lines) for a skill file.
+
+    Keyed on mtime so edits to the skills directory are picked up.
+    """
+    content = path.read_text(encoding="utf-8")
+    content_lower = content.lower()
+    return content_lower, content.split("\n"), content_lower.split("\n")
+
+
+def _local_search(query: str, max_results: int) -> list[dict]:
+    """Keyword search over the bundled skills files, one snippet per file."""
+    keywords = [w for w in _WHITESPACE_RE.split(query.lower()) if len(w) > 2]
+    if not keywords:
+        keywords = [query.lower()]
+    pattern = re.compile("|".join(map(re.escape, keywords)))
+    results = []
+    for fname in _skill_files():
+        content_lower, lines, lines_lower = _load_searchable_skill(fname, fname.stat().st_mtime_ns)
+        first = pattern.search(content_lower)
+        if first is None:
+            continue
+        # Find the first line that contains any keyword; none can precede the first hit
+        for i in range(content_lower.count("\n", 0, first.start()), len(lines_lower)):
+            if pattern.search(lines_lower[i]):
+                start = max(0, i - 2)
+                end = min(len(lines), i + 20)
+                snippet = "\n".join(lines[start:end])
+                results.append({"file": fname.name, "snippet": snippet})
+                break
+        if len(results) >= max_results:
+            break
+    return results
+
+
+# Leading fence (with optional language tag) or trailing fence. ``json`` is
+# listed before ``js`` so it is not matched as ``js`` + "on".
+_CODE_FENCE_RE = re.compile(r"\A```(?:javascript|json|js)?|```\Z")
+
+
 def _clean_code_response(text: str) -> str:
     """Strip markdown code fences from an AI response."""
-    cleaned = text.strip()
-    for prefix in ("```javascript", "```js", "```json", "```"):
-        if cleaned.startswith(prefix):
-            cleaned = cleaned[len(prefix) :]
-            break
-    if cleaned.endswith("```"):
-        cleaned = cleaned[:-3]
-    return cleaned.strip()
+    return _CODE_FENCE_RE.sub("", text.strip()).strip()
+
+
+def _format_json_response(text: str) -> str:
+    """Strip fences from a JSON AI response and re-indent it; non-JSON is returned cleaned."""
+    cleaned = _clean_code_response(text)
+    try:
+        return orjson.dumps(orjson.loads(cleaned), option=orjson.OPT_INDENT_2).decode()
+    except orjson.JSONDecodeError:
+        return cleaned
 
 
+@lru_cache(maxsize=1)
 def _build_symbols_system_context() -> str:
     """Build the core Symbols/DOMQL v3 knowledge context from skills files."""
     parts = []
@@ -186,15 +514,55 @@ def _build_symbols_system_context() -> str:
     return "\n\n---\n\n".join(parts)
 
 
-# Cache the system context at module load
-_SYMBOLS_CONTEXT: str | None = None
+def _get_symbols_context() -> str:
+    return _build_symbols_system_context()
+
 
+async def _load_cached(builder: Callable[..., str], *args: Any) -> str:
+    """Call an lru_cached prompt builder, in a worker thread until it is warm.
 
-def _get_symbols_context() -> str:
-    global _SYMBOLS_CONTEXT
-    if _SYMBOLS_CONTEXT is None:
-        _SYMBOLS_CONTEXT = _build_symbols_system_context()
-    return _SYMBOLS_CONTEXT
+    The first call reads skills files from disk; running it off the event
+    loop keeps other tool calls responsive. Once the builder holds any entry
+    the skills it needs are in memory, so later calls stay on the loop.
+    """
+    if builder.cache_info().currsize:
+        return builder(*args)
+    return await asyncio.to_thread(builder, *args)
+
+
+@lru_cache(maxsize=None)
+def _prompt_prefix(intro: str) -> str:
+    """Return ``intro`` followed by the Symbols context block, built once per intro."""
+    return "".join((intro, "\n\n", _get_symbols_context(), "\n\n---\n\n"))
+
+
+# Skills files the generation prompts embed, read ahead of the first tool call
+_PROMPT_SKILLS = (
+    "CLAUDE.md",
+    "SYMBOLS_LOCAL_INSTRUCTIONS.md",
+    "DESIGN_DIRECTION.md",
+    "MIGRATE_TO_SYMBOLS.md",
+    "DOMQL_v2-v3_MIGRATION.md",
+)
+
+
+def _warm_skill_caches() -> None:
+    """Load the prompt skills, shared context and local search corpus into their lru caches.
+
+    The files are independent, so they are read in parallel threads.
+    """
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        prompt_reads = pool.map(_read_skill, _PROMPT_SKILLS)
+        search_reads = pool.map(lambda path: _load_searchable_skill(path, path.stat().st_mtime_ns), _skill_files())
+        # Drain both maps so they run to completion inside the pool
+        list(prompt_reads)
+        list(search_reads)
+    _build_symbols_system_context()
+
+
+def _start_skill_warm_up() -> asyncio.Task:
+    """Warm the skills caches in a worker thread while the server starts serving."""
+    return asyncio.create_task(asyncio.to_thread(_warm_skill_caches))
 
 
 # ---------------------------------------------------------------------------
@@ -215,24 +583,9 @@ def get_project_rules() -> str:
     return _load_agent_instructions()
 
 
-@mcp.tool()
-async def generate_component(
-    description: str,
-    component_name: str = "GeneratedComponent",
-    interactive: bool = False,
-) -> str:
-    """Generate a Symbols/DOMQL v3 component from a natural-language description.
-
-    Args:
-        description: What the component should do/look like (e.g. "a pricing card with 3 tiers").
-        component_name: PascalCase name for the component export.
-        interactive: If True, include event handlers and state management.
-    """
-    ctx = _get_symbols_context()
+_COMPONENT_INTRO = "You are an expert Symbols/DOMQL v3 developer. Generate a production-ready component."
 
-    interactive_note = ""
-    if interactive:
-        interactive_note = """
+_COMPONENT_INTERACTIVE_NOTE = """
 IMPORTANT — This component must be INTERACTIVE:
 - Include realistic event handlers (onClick, onInput, onSubmit, etc.)
 - Add state management where needed (state: { ... }, s.update({ ... }))
@@ -240,23 +593,16 @@ IMPORTANT — This component must be INTERACTIVE:
 - Make buttons, inputs, and toggles functional
 """
 
-    prompt = f"""You are an expert Symbols/DOMQL v3 developer. Generate a production-ready component.
-
-{ctx}
-
----
-
-TASK: Create a component named `{component_name}` based on this description:
-
-{description}
-
-{interactive_note}
+# Rule 4 embeds the component name, so the rules are split around it
+_COMPONENT_RULES_HEAD = """
 
 RULES:
 1. Output ONLY the JavaScript code — no markdown, no explanations.
 2. Use DOMQL v3 syntax exclusively (extends, childExtends, flattened props, onX events).
 3. Use design-system tokens for spacing (padding: 'A', gap: 'B'), colors, and typography.
-4. Components are plain objects with named exports: export const {component_name} = {{ ... }}
+4. Components are plain objects with named exports: export const """
+
+_COMPONENT_RULES_TAIL = """ = { ... }
 5. NO imports between project files. Reference child components by PascalCase key.
 6. Keep folders flat — this is a single component file.
 7. Follow the modern UI/UX direction: clarity, hierarchy, minimal cognitive load.
@@ -264,9 +610,9 @@ RULES:
 CRITICAL ICON RULES — ALWAYS FOLLOW:
 8. NEVER use `Icon` component inside `Button` or `Flex+tag:button` — it will NOT render.
 9. For icon buttons, use `extends: 'Flex', tag: 'button'` with a `Svg` child (key must be `Svg`):
-   MyBtn: {{ extends: 'Flex', tag: 'button', flexAlign: 'center center', cursor: 'pointer',
-     Svg: {{ viewBox: '0 0 24 24', width: '22', height: '22', color: 'flame',
-       html: '<path d="..." fill="currentColor"/>' }} }}
+   MyBtn: { extends: 'Flex', tag: 'button', flexAlign: 'center center', cursor: 'pointer',
+     Svg: { viewBox: '0 0 24 24', width: '22', height: '22', color: 'flame',
+       html: '<path d="..." fill="currentColor"/>' } }
 10. The `html` prop ONLY works on the `Svg` atom — NOT on Flex/Box/Button.
 11. For standalone SVG icons (not in buttons), use key name `Svg` directly.
 12. Use `flexAlign` (not `align`) for alignItems+justifyContent shorthand on Flex.
@@ -276,37 +622,71 @@ CRITICAL ICON RULES — ALWAYS FOLLOW:
 
 OUTPUT:
 """
-    response = await _call_openrouter(prompt)
-    return _clean_code_response(response)
+
+
+def _component_task(description: str, component_name: str, interactive: bool) -> str:
+    """Task-specific part of a component prompt; the shared context goes in the system message."""
+    return "".join((
+        "TASK: Create a component named `", component_name, "` based on this description:\n\n",
+        description, "\n\n",
+        _COMPONENT_INTERACTIVE_NOTE if interactive else "",
+        _COMPONENT_RULES_HEAD, component_name, _COMPONENT_RULES_TAIL,
+    ))
 
 
 @mcp.tool()
-async def generate_page(
+async def generate_component(
     description: str,
-    page_name: str = "main",
-    route: str = "/",
+    component_name: str = "GeneratedComponent",
+    interactive: bool = False,
+    ctx: Context | None = None,
 ) -> str:
-    """Generate a Symbols/DOMQL v3 page with routing support.
+    """Generate a Symbols/DOMQL v3 component from a natural-language description.
 
     Args:
-        description: What the page should contain (e.g. "a dashboard with metrics cards and a chart").
-        page_name: camelCase name for the page export.
-        route: The URL route for this page (e.g. "/dashboard").
+        description: What the component should do/look like (e.g. "a pricing card with 3 tiers").
+        component_name: PascalCase name for the component export.
+        interactive: If True, include event handlers and state management.
     """
-    ctx = _get_symbols_context()
-    prompt = f"""You are an expert Symbols/DOMQL v3 developer. Generate a production-ready page.
+    system = await _load_cached(_prompt_prefix, _COMPONENT_INTRO)
+    prompt = _component_task(description, component_name, interactive)
+    response = await _call_openrouter(prompt, system=system, ctx=ctx)
+    return _clean_code_response(response)
 
-{ctx}
 
----
+@mcp.tool()
+async def generate_components_batch(components: dict[str, str], interactive: bool = False) -> str:
+    """Generate several Symbols/DOMQL v3 components at once, in parallel.
 
-TASK: Create a page named `{page_name}` (route: {route}) based on this description:
+    Args:
+        components: Mapping of PascalCase component name to its description
+            (e.g. {"PricingCard": "a pricing card with 3 tiers", "Navbar": "a top nav with logo and links"}).
+        interactive: If True, include event handlers and state management in every component.
 
-{description}
+    Returns a JSON object mapping each component name to its generated code.
+    """
+    names = list(components)
+    system = await _load_cached(_prompt_prefix, _COMPONENT_INTRO)
+    responses = await _call_openrouter_many(
+        [_component_task(components[name], name, interactive) for name in names],
+        system=system,
+    )
+    return orjson.dumps(
+        {name: _clean_code_response(response) for name, response in zip(names, responses)},
+        option=orjson.OPT_INDENT_2,
+    ).decode()
+
+
+_PAGE_INTRO = "You are an expert Symbols/DOMQL v3 developer. Generate a production-ready page."
+
+# Rule 2 embeds the page name, so the rules are split around it
+_PAGE_RULES_HEAD = """
 
 RULES:
 1. Output ONLY the JavaScript code — no markdown, no explanations.
-2. Pages extend from 'Page': export const {page_name} = {{ extends: 'Page', ... }}
+2. Pages extend from 'Page': export const """
+
+_PAGE_RULES_TAIL = """ = { extends: 'Page', ... }
 3. Use DOMQL v3 syntax exclusively.
 4. Use design-system tokens for all spacing, colors, typography.
 5. Reference child components by PascalCase key name — no imports.
@@ -316,9 +696,9 @@ RULES:
 
 CRITICAL RULES — ALWAYS FOLLOW:
 9. NEVER use `Icon` inside `Button` or `Flex+tag:button` — use `Svg` atom with `html` prop instead.
-   IconBtn: {{ extends: 'Flex', tag: 'button', flexAlign: 'center center', cursor: 'pointer',
-     Svg: {{ viewBox: '0 0 24 24', width: '22', height: '22', color: 'primary',
-       html: '<path d="..." fill="currentColor"/>' }} }}
+   IconBtn: { extends: 'Flex', tag: 'button', flexAlign: 'center center', cursor: 'pointer',
+     Svg: { viewBox: '0 0 24 24', width: '22', height: '22', color: 'primary',
+       html: '<path d="..." fill="currentColor"/>' } }
 10. `html` prop ONLY works on `Svg` atom — NOT on Flex/Box/Button.
 11. Use `flexAlign` (not `align`) for combined alignItems+justifyContent on Flex.
 12. `el.call('fn', arg)` passes element as `this` inside fn — NEVER pass `el` as argument.
@@ -326,52 +706,49 @@ CRITICAL RULES — ALWAYS FOLLOW:
 
 OUTPUT:
 """
-    response = await _call_openrouter(prompt)
-    return _clean_code_response(response)
 
 
 @mcp.tool()
-async def generate_project(
+async def generate_page(
     description: str,
-    project_name: str = "my-symbols-app",
+    page_name: str = "main",
+    route: str = "/",
+    ctx: Context | None = None,
 ) -> str:
-    """Generate a complete multi-file Symbols/DOMQL v3 project structure.
+    """Generate a Symbols/DOMQL v3 page with routing support.
 
     Args:
-        description: What the application should be (e.g. "a restaurant website with menu, about, and contact pages").
-        project_name: Name for the project.
+        description: What the page should contain (e.g. "a dashboard with metrics cards and a chart").
+        page_name: camelCase name for the page export.
+        route: The URL route for this page (e.g. "/dashboard").
     """
-    ctx = _get_symbols_context()
-    local_instructions = _read_skill("SYMBOLS_LOCAL_INSTRUCTIONS.md")
-
-    prompt = f"""You are an expert Symbols/DOMQL v3 architect. Generate a COMPLETE project.
-
-{ctx}
-
----
-
-PROJECT STRUCTURE REFERENCE:
-{local_instructions}
+    system = await _load_cached(_prompt_prefix, _PAGE_INTRO)
+    prompt = "".join((
+        "TASK: Create a page named `", page_name, "` (route: ", route, ") based on this description:\n\n",
+        description,
+        _PAGE_RULES_HEAD, page_name, _PAGE_RULES_TAIL,
+    ))
+    response = await _call_openrouter(prompt, system=system, ctx=ctx)
+    return _clean_code_response(response)
 
----
 
-TASK: Create a complete Symbols project called "{project_name}" based on:
+_PROJECT_INTRO = "You are an expert Symbols/DOMQL v3 architect. Generate a COMPLETE project."
 
-{description}
+_PROJECT_RULES = """
 
 OUTPUT FORMAT — Return a JSON object with this exact structure:
-{{
+{
   "type": "project_structure",
   "title": "Project title",
   "description": "Brief description",
   "files": [
-    {{
+    {
       "path": "smbls/index.js",
       "language": "javascript",
       "code": "// file contents here"
-    }}
+    }
   ]
-}}
+}
 
 MANDATORY FILE TEMPLATES — every generated project MUST follow these exactly:
 
@@ -381,46 +758,46 @@ smbls/components/index.js — MUST use `export *` NOT `export * as`:
   // one line per component — NEVER: export * as Navbar from './Navbar.js'
 
 smbls/pages/index.js — the ONLY file where imports are allowed:
-  import {{ main }} from './main.js'
-  export default {{ '/': main }}
+  import { main } from './main.js'
+  export default { '/': main }
 
 smbls/pages/main.js — pages MUST extend 'Page':
-  export const main = {{ extends: 'Page', ... }}
+  export const main = { extends: 'Page', ... }
   // NEVER: extends: 'Flex' or extends: 'Box' for a page
 
 smbls/functions/index.js:
   export * from './myFunction.js'
 
 smbls/functions/myFunction.js — functions use named function expressions:
-  export const myFunction = function myFunction(arg) {{
+  export const myFunction = function myFunction(arg) {
     const node = this.node  // 'this' is the DOMQL element, NOT a parameter
-  }}
+  }
 
 smbls/state.js — inline initial state, NO imports:
-  export default {{ activePage: 'home', user: {{}}, items: [] }}
+  export default { activePage: 'home', user: {}, items: [] }
 
 smbls/index.js — root registry:
-  export {{ default as state }} from './state.js'
-  export {{ default as dependencies }} from './dependencies.js'
+  export { default as state } from './state.js'
+  export { default as dependencies } from './dependencies.js'
   export * as components from './components/index.js'
-  export {{ default as pages }} from './pages/index.js'
+  export { default as pages } from './pages/index.js'
   export * as functions from './functions/index.js'
   export * as methods from './methods/index.js'
-  export {{ default as designSystem }} from './designSystem/index.js'
+  export { default as designSystem } from './designSystem/index.js'
 
 MULTI-VIEW NAVIGATION — use DOM IDs + switchView function, NOT reactive display bindings:
   // In main page — assign id to each view:
-  HomeView: {{ id: 'view-home', extends: 'Flex', flexDirection: 'column' }},
-  AboutView: {{ id: 'view-about', extends: 'Flex', flexDirection: 'column', display: 'none' }},
+  HomeView: { id: 'view-home', extends: 'Flex', flexDirection: 'column' },
+  AboutView: { id: 'view-about', extends: 'Flex', flexDirection: 'column', display: 'none' },
   // In Navbar onClick:
-  onClick: (e, el) => {{ el.call('switchView', 'about') }}
+  onClick: (e, el) => { el.call('switchView', 'about') }
   // In functions/switchView.js:
-  export const switchView = function switchView(view) {{
-    ['home', 'about'].forEach(function(v) {{
+  export const switchView = function switchView(view) {
+    ['home', 'about'].forEach(function(v) {
       const el = document.getElementById('view-' + v)
       if (el) el.style.display = v === view ? 'flex' : 'none'
-    }})
-  }}
+    })
+  }
 
 RULES:
 1. Include ALL required files: smbls/index.js, smbls/state.js, smbls/dependencies.js, smbls/pages/index.js, smbls/components/index.js, smbls/functions/index.js, smbls/designSystem/index.js
@@ -428,7 +805,7 @@ RULES:
 3. Use DOMQL v3 syntax exclusively — NO React/Vue/Angular syntax.
 4. Use design-system tokens for spacing/colors — NOT hardcoded pixel values.
 5. All folders are FLAT — no subfolders within components/, pages/, functions/, etc.
-6. Components: named exports (`export const X = {{}}`). DesignSystem: default exports.
+6. Components: named exports (`export const X = {}`). DesignSystem: default exports.
 7. NO imports between component/function/page files — reference components by PascalCase key in tree.
 8. Output ONLY the JSON — no markdown fences, no explanations.
 
@@ -436,70 +813,62 @@ CRITICAL RULES — violations cause silent failures (black page, nothing renders
 9. `components/index.js`: ALWAYS `export * from './X.js'` — NEVER `export * as X from './X.js'`
 10. Pages: ALWAYS `extends: 'Page'` — NEVER `extends: 'Flex'` or `extends: 'Box'`
 11. NEVER use `Icon` inside `Button` or `Flex+tag:button` — use `Svg` atom with `html` prop:
-    Btn: {{ extends: 'Flex', tag: 'button', flexAlign: 'center center', cursor: 'pointer',
-      Svg: {{ viewBox: '0 0 24 24', width: '22', height: '22',
-        html: '<path d="..." fill="currentColor"/>' }} }}
+    Btn: { extends: 'Flex', tag: 'button', flexAlign: 'center center', cursor: 'pointer',
+      Svg: { viewBox: '0 0 24 24', width: '22', height: '22',
+        html: '<path d="..." fill="currentColor"/>' } }
 12. `html` prop ONLY works on `Svg` atom — NOT on Flex/Box/Button.
 13. `flexAlign` (not `align`) for alignItems+justifyContent shorthand on Flex.
 14. `el.call('fn', arg)` — element is `this` inside fn — NEVER pass `el` as argument.
 15. Guard `onRender`: `if (el.__initialized) return; el.__initialized = true`
-16. State updates: `s.update({{ key: val }})` — NEVER mutate `s.key = val` directly.
+16. State updates: `s.update({ key: val })` — NEVER mutate `s.key = val` directly.
 17. `childExtends` MUST be a string name — NEVER an inline object. Inline objects dump all prop values as visible text on every child:
-    WRONG: childExtends: {{ tag: 'button', color: 'white', border: '2px solid transparent' }}
+    WRONG: childExtends: { tag: 'button', color: 'white', border: '2px solid transparent' }
     CORRECT: childExtends: 'NavLink'  (define NavLink as a named component in components/)
 18. Color opacity: NEVER use `color: 'white .7'` — it renders as raw text. Define named tokens:
-    COLOR.js: {{ whiteMuted: 'rgba(255,255,255,0.7)', whiteSubtle: 'rgba(255,255,255,0.6)' }}
+    COLOR.js: { whiteMuted: 'rgba(255,255,255,0.7)', whiteSubtle: 'rgba(255,255,255,0.6)' }
     Then use: `color: 'whiteMuted'`
-18. Border shorthand: NEVER use `border: '2px solid transparent'` — it renders as raw text.
+19. Border shorthand: NEVER use `border: '2px solid transparent'` — it renders as raw text.
     Always split: `borderWidth: '2px', borderStyle: 'solid', borderColor: 'transparent'`
     Only `border: 'none'` is safe as a shorthand.
 
 OUTPUT:
 """
-    response = await _call_openrouter(prompt, max_tokens=16000)
-    cleaned = _clean_code_response(response)
 
-    # Validate JSON
-    try:
-        parsed = json.loads(cleaned)
-        return json.dumps(parsed, indent=2)
-    except json.JSONDecodeError:
-        return cleaned
+
+@lru_cache(maxsize=1)
+def _project_prompt_prefix() -> str:
+    """Context plus the project-structure reference, shared by every project prompt."""
+    return "".join((
+        _prompt_prefix(_PROJECT_INTRO),
+        "PROJECT STRUCTURE REFERENCE:\n", _read_skill("SYMBOLS_LOCAL_INSTRUCTIONS.md"), "\n\n---\n\n",
+    ))
 
 
 @mcp.tool()
-async def convert_to_symbols(
-    code: str,
-    source_framework: str = "auto",
+async def generate_project(
+    description: str,
+    project_name: str = "my-symbols-app",
+    ctx: Context | None = None,
 ) -> str:
-    """Convert React, Angular, Vue, or HTML code to Symbols/DOMQL v3 format.
+    """Generate a complete multi-file Symbols/DOMQL v3 project structure.
 
     Args:
-        code: The source code to convert (React JSX, Angular template, Vue SFC, or HTML).
-        source_framework: Source framework — "auto", "react", "angular", "vue", or "html".
+        description: What the application should be (e.g. "a restaurant website with menu, about, and contact pages").
+        project_name: Name for the project.
     """
-    migration_guide = _read_skill("MIGRATE_TO_SYMBOLS.md")
-    v3_migration = _read_skill("DOMQL_v2-v3_MIGRATION.md")
-    ctx = _get_symbols_context()
-
-    prompt = f"""You are an expert migration assistant converting code to Symbols/DOMQL v3.
+    system = await _load_cached(_project_prompt_prefix)
+    prompt = "".join((
+        'TASK: Create a complete Symbols project called "', project_name, '" based on:\n\n',
+        description,
+        _PROJECT_RULES,
+    ))
+    response = await _call_openrouter(prompt, system=system, max_tokens=16000, ctx=ctx)
+    return _format_json_response(response)
 
-{ctx}
 
----
-
-MIGRATION REFERENCE:
-{migration_guide}
-
-V2→V3 CHANGES:
-{v3_migration}
-
----
-
-TASK: Convert this {source_framework} code to Symbols/DOMQL v3 format:
+_CONVERT_INTRO = "You are an expert migration assistant converting code to Symbols/DOMQL v3."
 
-```
-{code}
+_CONVERT_RULES = """
 ```
 
 RULES:
@@ -513,10 +882,71 @@ RULES:
 
 OUTPUT:
 """
-    response = await _call_openrouter(prompt, max_tokens=12000)
+
+
+@lru_cache(maxsize=1)
+def _convert_prompt_prefix() -> str:
+    """Context plus both migration references, shared by every conversion prompt."""
+    return "".join((
+        _prompt_prefix(_CONVERT_INTRO),
+        "MIGRATION REFERENCE:\n", _read_skill("MIGRATE_TO_SYMBOLS.md"),
+        "\n\nV2→V3 CHANGES:\n", _read_skill("DOMQL_v2-v3_MIGRATION.md"), "\n\n---\n\n",
+    ))
+
+
+@mcp.tool()
+async def convert_to_symbols(
+    code: str,
+    source_framework: str = "auto",
+    ctx: Context | None = None,
+) -> str:
+    """Convert React, Angular, Vue, or HTML code to Symbols/DOMQL v3 format.
+
+    Args:
+        code: The source code to convert (React JSX, Angular template, Vue SFC, or HTML).
+        source_framework: Source framework — "auto", "react", "angular", "vue", or "html".
+    """
+    system = await _load_cached(_convert_prompt_prefix)
+    prompt = "".join((
+        "TASK: Convert this ", source_framework, " code to Symbols/DOMQL v3 format:\n\n```\n",
+        code,
+        _CONVERT_RULES,
+    ))
+    response = await _call_openrouter(prompt, system=system, max_tokens=12000, ctx=ctx)
     return _clean_code_response(response)
 
 
+async def _supabase_search(query: str, max_results: int) -> list[dict]:
+    """Query the Supabase vector search RPC; failures are logged and yield no results."""
+    supabase_results = []
+    try:
+        resp = await _get_http_client().post(
+            f"{SUPABASE_URL}/rest/v1/rpc/match_documents",
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}",
+                "Content-Type": "application/json",
+            },
+            json={"query_text": query, "match_count": max_results},
+            timeout=30.0,
+        )
+        if resp.status_code == 200:
+            # Slice each body as it is copied; the full parsed rows are dropped right after
+            supabase_results = [
+                {
+                    "title": doc.get("title", "Untitled"),
+                    "content": doc.get("content", "")[:1000],
+                    "similarity": doc.get("similarity", 0),
+                }
+                for doc in orjson.loads(resp.content)[:max_results]
+            ]
+        else:
+            logger.warning(f"Supabase search returned status {resp.status_code}.")
+    except Exception as e:
+        logger.warning(f"Supabase search failed: {e}")
+    return supabase_results
+
+
 @mcp.tool()
 async def search_symbols_docs(
     query: str,
@@ -530,100 +960,27 @@ async def search_symbols_docs(
     """
     if not SUPABASE_URL or not SUPABASE_KEY:
         # Fall back to local skills search if no Supabase
-        keywords = [w for w in re.split(r"\s+", query.lower()) if len(w) > 2]
-        if not keywords:
-            keywords = [query.lower()]
-        results = []
-        for fname in SKILLS_PATH.glob("*.md"):
-            content = fname.read_text(encoding="utf-8")
-            content_lower = content.lower()
-            if not any(kw in content_lower for kw in keywords):
-                continue
-            # Find the first line that contains any keyword
-            lines = content.split("\n")
-            for i, line in enumerate(lines):
-                line_lower = line.lower()
-                if any(kw in line_lower for kw in keywords):
-                    start = max(0, i - 2)
-                    end = min(len(lines), i + 20)
-                    snippet = "\n".join(lines[start:end])
-                    results.append({"file": fname.name, "snippet": snippet})
-                    break
-            if len(results) >= max_results:
-                break
-
+        results = await asyncio.to_thread(_local_search, query, max_results)
         if results:
-            return json.dumps(results, indent=2)
+            return orjson.dumps(results, option=orjson.OPT_INDENT_2).decode()
         return f"No results found for '{query}'. Try a different search term."
 
-    # Always run local keyword search
-    keywords = [w for w in re.split(r"\s+", query.lower()) if len(w) > 2]
-    if not keywords:
-        keywords = [query.lower()]
-    local_results = []
-    for fname in SKILLS_PATH.glob("*.md"):
-        content = fname.read_text(encoding="utf-8")
-        content_lower = content.lower()
-        if not any(kw in content_lower for kw in keywords):
-            continue
-        lines = content.split("\n")
-        for i, line in enumerate(lines):
-            line_lower = line.lower()
-            if any(kw in line_lower for kw in keywords):
-                start = max(0, i - 2)
-                end = min(len(lines), i + 20)
-                snippet = "\n".join(lines[start:end])
-                local_results.append({"file": fname.name, "snippet": snippet})
-                break
-        if len(local_results) >= max_results:
-            break
-
-    # Also query Supabase vector search if available
-    supabase_results = []
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(
-                f"{SUPABASE_URL}/rest/v1/rpc/match_documents",
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={"query_text": query, "match_count": max_results},
-            )
-            if resp.status_code == 200:
-                for doc in resp.json()[:max_results]:
-                    supabase_results.append({
-                        "title": doc.get("title", "Untitled"),
-                        "content": doc.get("content", "")[:1000],
-                        "similarity": doc.get("similarity", 0),
-                    })
-            else:
-                logger.warning(f"Supabase search returned status {resp.status_code}.")
-    except Exception as e:
-        logger.warning(f"Supabase search failed: {e}")
+    # Run the local keyword search (off the event loop) alongside the
+    # Supabase vector search
+    local_results, supabase_results = await asyncio.gather(
+        asyncio.to_thread(_local_search, query, max_results),
+        _supabase_search(query, max_results),
+    )
 
     results = supabase_results + local_results
     if results:
-        return json.dumps(results[:max_results], indent=2)
+        return orjson.dumps(results[:max_results], option=orjson.OPT_INDENT_2).decode()
     return f"No results found for '{query}'. Try a different search term."
 
 
-@mcp.tool()
-async def explain_symbols_concept(concept: str) -> str:
-    """Explain a Symbols/DOMQL concept with examples (state, routing, events, design tokens, etc.).
-
-    Args:
-        concept: The concept to explain (e.g. "state management", "routing", "design tokens", "events", "children pattern").
-    """
-    ctx = _get_symbols_context()
-    prompt = f"""You are an expert Symbols/DOMQL v3 instructor.
-
-{ctx}
-
----
+_EXPLAIN_INTRO = "You are an expert Symbols/DOMQL v3 instructor."
 
-TASK: Explain the concept "{concept}" in Symbols/DOMQL v3.
+_EXPLAIN_RULES = """" in Symbols/DOMQL v3.
 
 RULES:
 1. Give a clear, concise explanation (2-3 paragraphs max).
@@ -634,31 +991,27 @@ RULES:
 
 OUTPUT:
 """
-    return await _call_openrouter(prompt, max_tokens=4000)
 
 
 @mcp.tool()
-async def review_symbols_code(code: str) -> str:
-    """Review Symbols/DOMQL code for correctness, best practices, and v3 compliance.
+async def explain_symbols_concept(concept: str, ctx: Context | None = None) -> str:
+    """Explain a Symbols/DOMQL concept with examples (state, routing, events, design tokens, etc.).
 
     Args:
-        code: The Symbols/DOMQL code to review.
+        concept: The concept to explain (e.g. "state management", "routing", "design tokens", "events", "children pattern").
     """
-    ctx = _get_symbols_context()
-    prompt = f"""You are a strict Symbols/DOMQL v3 code reviewer.
-
-{ctx}
+    system = await _load_cached(_prompt_prefix, _EXPLAIN_INTRO)
+    prompt = "".join(('TASK: Explain the concept "', concept, _EXPLAIN_RULES))
+    return await _call_openrouter_cached(prompt, system=system, max_tokens=4000, ctx=ctx)
 
----
 
-TASK: Review this Symbols/DOMQL code for correctness and best practices:
+_REVIEW_INTRO = "You are a strict Symbols/DOMQL v3 code reviewer."
 
-```javascript
-{code}
+_REVIEW_RULES = """
 ```
 
 CHECK FOR:
-1. v2 syntax violations: extend (should be extends), childExtend (should be childExtends), props: {{ }} wrapper, on: {{ }} wrapper
+1. v2 syntax violations: extend (should be extends), childExtend (should be childExtends), props: { } wrapper, on: { } wrapper
 2. Forbidden imports between project files
 3. Function-based components (must be plain objects)
 4. Subfolder usage (must be flat)
@@ -675,49 +1028,43 @@ OUTPUT FORMAT:
 
 OUTPUT:
 """
-    return await _call_openrouter(prompt, max_tokens=6000)
 
 
 @mcp.tool()
-async def create_design_system(
-    description: str,
-    include_theme: bool = True,
-    include_icons: bool = True,
-) -> str:
-    """Generate Symbols design system files (colors, spacing, typography, theme, icons).
+async def review_symbols_code(code: str, ctx: Context | None = None) -> str:
+    """Review Symbols/DOMQL code for correctness, best practices, and v3 compliance.
 
     Args:
-        description: Description of the design direction (e.g. "dark modern SaaS dashboard", "light minimal e-commerce").
-        include_theme: Whether to include theme definitions.
-        include_icons: Whether to include a basic icon set.
+        code: The Symbols/DOMQL code to review.
     """
-    ctx = _get_symbols_context()
-    design_direction = _read_skill("DESIGN_DIRECTION.md")
-
-    prompt = f"""You are an expert Symbols design-system architect.
+    system = await _load_cached(_prompt_prefix, _REVIEW_INTRO)
+    prompt = "".join((
+        "TASK: Review this Symbols/DOMQL code for correctness and best practices:\n\n```javascript\n",
+        code,
+        _REVIEW_RULES,
+    ))
+    return await _call_openrouter_cached(prompt, system=system, max_tokens=6000, ctx=ctx)
 
-{ctx}
 
----
+_DESIGN_SYSTEM_INTRO = "You are an expert Symbols design-system architect."
 
-DESIGN DIRECTION:
-{design_direction}
-
----
-
-TASK: Create a complete design system for: "{description}"
+_DESIGN_SYSTEM_FILES_HEAD = """"
 
 Generate the following files as a JSON object:
-{{
+{
   "files": [
-    {{ "path": "designSystem/color.js", "code": "export default {{ ... }}" }},
-    {{ "path": "designSystem/spacing.js", "code": "export default {{ ... }}" }},
-    {{ "path": "designSystem/typography.js", "code": "export default {{ ... }}" }},
-    {('{{ "path": "designSystem/theme.js", "code": "..." }},' if include_theme else "")}
-    {('{{ "path": "designSystem/icons.js", "code": "..." }},' if include_icons else "")}
-    {{ "path": "designSystem/index.js", "code": "..." }}
+    { "path": "designSystem/color.js", "code": "export default { ... }" },
+    { "path": "designSystem/spacing.js", "code": "export default { ... }" },
+    { "path": "designSystem/typography.js", "code": "export default { ... }" },
+    """
+
+_DESIGN_SYSTEM_THEME_FILE = '{ "path": "designSystem/theme.js", "code": "..." },'
+_DESIGN_SYSTEM_ICONS_FILE = '{ "path": "designSystem/icons.js", "code": "..." },'
+
+_DESIGN_SYSTEM_RULES = """
+    { "path": "designSystem/index.js", "code": "..." }
   ]
-}}
+}
 
 RULES:
 1. Colors: Define a cohesive palette with semantic names. Support dark/light modes using array format.
@@ -731,13 +1078,42 @@ RULES:
 
 OUTPUT:
 """
-    response = await _call_openrouter(prompt, max_tokens=10000)
-    cleaned = _clean_code_response(response)
-    try:
-        parsed = json.loads(cleaned)
-        return json.dumps(parsed, indent=2)
-    except json.JSONDecodeError:
-        return cleaned
+
+
+@lru_cache(maxsize=1)
+def _design_system_prompt_prefix() -> str:
+    """Context plus the design direction, shared by every design-system prompt."""
+    return "".join((
+        _prompt_prefix(_DESIGN_SYSTEM_INTRO),
+        "DESIGN DIRECTION:\n", _read_skill("DESIGN_DIRECTION.md"), "\n\n---\n\n",
+    ))
+
+
+@mcp.tool()
+async def create_design_system(
+    description: str,
+    include_theme: bool = True,
+    include_icons: bool = True,
+    ctx: Context | None = None,
+) -> str:
+    """Generate Symbols design system files (colors, spacing, typography, theme, icons).
+
+    Args:
+        description: Description of the design direction (e.g. "dark modern SaaS dashboard", "light minimal e-commerce").
+        include_theme: Whether to include theme definitions.
+        include_icons: Whether to include a basic icon set.
+    """
+    system = await _load_cached(_design_system_prompt_prefix)
+    prompt = "".join((
+        'TASK: Create a complete design system for: "', description,
+        _DESIGN_SYSTEM_FILES_HEAD,
+        _DESIGN_SYSTEM_THEME_FILE if include_theme else "",
+        "\n    ",
+        _DESIGN_SYSTEM_ICONS_FILE if include_icons else "",
+        _DESIGN_SYSTEM_RULES,
+    ))
+    response = await _call_openrouter(prompt, system=system, max_tokens=10000, ctx=ctx)
+    return _format_json_response(response)
 
 
 # ---------------------------------------------------------------------------
@@ -781,10 +1157,7 @@ def get_quickstart() -> str:
     return _read_skill("QUICKSTART.md")
 
 
-@mcp.resource("symbols://reference/spacing-tokens")
-def get_spacing_tokens() -> str:
-    """Spacing token reference for the Symbols design system."""
-    return """# Symbols Spacing Tokens
+_SPACING_TOKENS_DOC = """# Symbols Spacing Tokens
 
 Ratio-based system (base 16px, ratio 1.618 golden ratio):
 
@@ -807,10 +1180,13 @@ Math: padding: 'A+V2'
 """
 
 
-@mcp.resource("symbols://reference/atom-components")
-def get_atom_components() -> str:
-    """Built-in primitive atom components in Symbols."""
-    return """# Symbols Atom Components (Primitives)
+@mcp.resource("symbols://reference/spacing-tokens")
+def get_spacing_tokens() -> str:
+    """Spacing token reference for the Symbols design system."""
+    return _SPACING_TOKENS_DOC
+
+
+_ATOM_COMPONENTS_DOC = """# Symbols Atom Components (Primitives)
 
 | Atom       | HTML Tag   | Description                   |
 |------------|------------|-------------------------------|
@@ -841,10 +1217,13 @@ Usage examples:
 """
 
 
-@mcp.resource("symbols://reference/event-handlers")
-def get_event_handlers() -> str:
-    """Event handler reference for Symbols/DOMQL v3."""
-    return """# Symbols Event Handlers (v3)
+@mcp.resource("symbols://reference/atom-components")
+def get_atom_components() -> str:
+    """Built-in primitive atom components in Symbols."""
+    return _ATOM_COMPONENTS_DOC
+
+
+_EVENT_HANDLERS_DOC = """# Symbols Event Handlers (v3)
 
 ## Lifecycle Events
   onInit: (el, state) => {}              // Once on creation
@@ -883,22 +1262,29 @@ def get_event_handlers() -> str:
 """
 
 
+@mcp.resource("symbols://reference/event-handlers")
+def get_event_handlers() -> str:
+    """Event handler reference for Symbols/DOMQL v3."""
+    return _EVENT_HANDLERS_DOC
+
+
 # ---------------------------------------------------------------------------
 # PROMPTS — Reusable prompt templates for common tasks
 # ---------------------------------------------------------------------------
 
+# Static template text lives in constants; only the arguments are joined in per call
+_COMPONENT_PROMPT_HEAD = """Generate a Symbols/DOMQL v3 component with these requirements:
 
-@mcp.prompt()
-def symbols_component_prompt(description: str, component_name: str = "MyComponent") -> str:
-    """Prompt template for generating a Symbols/DOMQL v3 component."""
-    return f"""Generate a Symbols/DOMQL v3 component with these requirements:
+Component Name: """
 
-Component Name: {component_name}
-Description: {description}
+# The rules embed the component name, so they are split around it
+_COMPONENT_PROMPT_RULES_HEAD = """
 
 Follow these strict rules:
 - Use DOMQL v3 syntax ONLY (extends, childExtends, flattened props, onX events)
-- Components are plain objects with named exports: export const {component_name} = {{ ... }}
+- Components are plain objects with named exports: export const """
+
+_COMPONENT_PROMPT_RULES_TAIL = """ = { ... }
 - Use design-system tokens for spacing (A, B, C), colors, typography
 - NO imports between files — reference components by PascalCase key name
 - All folders flat — no subfolders
@@ -908,32 +1294,66 @@ Follow these strict rules:
 Output ONLY the JavaScript code."""
 
 
+@lru_cache(maxsize=256)
+def _component_prompt(description: str, component_name: str) -> str:
+    """Render the component prompt, cached per (description, name)."""
+    return "".join((
+        _COMPONENT_PROMPT_HEAD, component_name,
+        "\nDescription: ", description,
+        _COMPONENT_PROMPT_RULES_HEAD, component_name,
+        _COMPONENT_PROMPT_RULES_TAIL,
+    ))
+
+
 @mcp.prompt()
-def symbols_migration_prompt(source_framework: str = "React") -> str:
-    """Prompt template for migrating code to Symbols/DOMQL v3."""
-    return f"""You are migrating {source_framework} code to Symbols/DOMQL v3.
+def symbols_component_prompt(description: str, component_name: str = "MyComponent") -> str:
+    """Prompt template for generating a Symbols/DOMQL v3 component."""
+    return _component_prompt(description, component_name)
+
+
+_MIGRATION_PROMPT_INTRO = """ code to Symbols/DOMQL v3.
+
+Key conversion rules for """
 
-Key conversion rules for {source_framework}:
+_MIGRATION_PROMPT_RULES = """:
 - Components become plain objects (never functions)
 - NO imports between project files
 - All folders are flat — no subfolders
 - Use extends/childExtends (v3 plural, never v2 singular)
-- Flatten all props directly (no props: {{}} wrapper)
-- Events use onX prefix (no on: {{}} wrapper)
+- Flatten all props directly (no props: {} wrapper)
+- Events use onX prefix (no on: {} wrapper)
 - Use design-system tokens for spacing/colors
-- State: state: {{ key: val }} + s.update({{ key: newVal }})
+- State: state: { key: val } + s.update({ key: newVal })
 - Effects: onRender for mount, onStateUpdate for dependency changes
 - Lists: children: (el, s) => s.items, childrenAs: 'state', childExtends: 'Item'
 
-Provide the {source_framework} code to convert and I will output clean DOMQL v3."""
+Provide the """
+
+_MIGRATION_PROMPT_TAIL = " code to convert and I will output clean DOMQL v3."
+
+
+@lru_cache(maxsize=32)
+def _migration_prompt(source_framework: str) -> str:
+    """Render the migration prompt, cached per framework name."""
+    return "".join((
+        "You are migrating ", source_framework,
+        _MIGRATION_PROMPT_INTRO, source_framework,
+        _MIGRATION_PROMPT_RULES, source_framework,
+        _MIGRATION_PROMPT_TAIL,
+    ))
 
 
 @mcp.prompt()
-def symbols_project_prompt(description: str) -> str:
-    """Prompt template for scaffolding a complete Symbols project."""
-    return f"""Create a complete Symbols/DOMQL v3 project:
+def symbols_migration_prompt(source_framework: str = "React") -> str:
+    """Prompt template for migrating code to Symbols/DOMQL v3."""
+    return _migration_prompt(source_framework)
+
+
+_PROJECT_PROMPT_HEAD = """Create a complete Symbols/DOMQL v3 project:
+
+Project Description: """
 
-Project Description: {description}
+_PROJECT_PROMPT_RULES = """
 
 Required structure (smbls/ folder):
 - index.js (root export)
@@ -957,9 +1377,12 @@ Generate all files with complete, production-ready code."""
 
 
 @mcp.prompt()
-def symbols_review_prompt() -> str:
-    """Prompt template for reviewing Symbols/DOMQL code."""
-    return """Review this Symbols/DOMQL code for v3 compliance and best practices.
+def symbols_project_prompt(description: str) -> str:
+    """Prompt template for scaffolding a complete Symbols project."""
+    return "".join((_PROJECT_PROMPT_HEAD, description, _PROJECT_PROMPT_RULES))
+
+
+_REVIEW_PROMPT = """Review this Symbols/DOMQL code for v3 compliance and best practices.
 
 Check for these violations:
 1. v2 syntax: extend→extends, childExtend→childExtends, props:{}, on:{}
@@ -979,119 +1402,468 @@ Provide:
 Paste your code below:"""
 
 
+@mcp.prompt()
+def symbols_review_prompt() -> str:
+    """Prompt template for reviewing Symbols/DOMQL code."""
+    return _REVIEW_PROMPT
+
+
 # ---------------------------------------------------------------------------
 # Health Check for Railway
 # ---------------------------------------------------------------------------
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, StrictInt, StrictStr, ValidationError
+from sse_starlette.sse import EventSourceResponse
+from starlette.types import Receive, Scope, Send
+import uvicorn
 
-# Create FastAPI app for health check
-app = FastAPI()
 
-@app.get("/health")
-async def health_check():
+class _ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson instead of the stdlib encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+async def _warm_openrouter_connection() -> None:
+    """Open a pooled connection to OpenRouter so the first chat skips the handshake."""
+    try:
+        await _get_http_client().head(OPENROUTER_CHAT_URL, timeout=5.0)
+    except httpx.HTTPError as e:
+        logger.info(f"OpenRouter connection warm-up failed: {e}")
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """Open the shared upstream client on startup and close it on shutdown."""
+    _get_http_client()
+    skills_warm_up = _start_skill_warm_up()
+    warm_up = None
+    if OPENROUTER_API_KEY:
+        warm_up = asyncio.create_task(_warm_openrouter_connection())
+    yield
+    skills_warm_up.cancel()
+    if warm_up is not None:
+        warm_up.cancel()
+    await _close_http_client()
+
+
+# Create FastAPI app for health check
+app = FastAPI(lifespan=_lifespan, default_response_class=_ORJSONResponse)
+# Compresses buffered /api/chat completions; small static replies stay under
+# minimum_size, and Starlette (0.46.1+, pinned in pyproject.toml) skips
+# text/event-stream, so SSE and streamed chats are passed through untouched.
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
+# Every tool, resource and prompt is registered by now, so the counts are fixed
+_HEALTH_BODY = orjson.dumps({
+    "status": "healthy",
+    "server": "Symbols MCP Server",
+    "tools": len(mcp._tool_manager.list_tools()),
+    "resources": len(mcp._resource_manager.list_resources()),
+    "prompts": len(mcp._prompt_manager.list_prompts())
+})
+
+
+async def health_check(request: Request) -> Response:
     """Health check endpoint for Railway."""
-    return JSONResponse({
-        "status": "healthy",
-        "server": "Symbols MCP Server",
-        "tools": len(mcp._tool_manager.list_tools()),
-        "resources": len(mcp._resource_manager.list_resources()),
-        "prompts": len(mcp._prompt_manager.list_prompts())
-    })
+    return Response(_HEALTH_BODY, media_type="application/json")
+
+
+# A plain Starlette route: probes skip FastAPI's dependency and response handling
+app.add_route("/health", health_check, methods=["GET"], include_in_schema=False)
+
+# Credentials come from this process's own environment, which is fixed at start-up
+_CONFIG_BODY = (
+    orjson.dumps({"supabase_url": os.environ["SUPABASE_URL"], "supabase_key": os.environ["SUPABASE_KEY"]})
+    if os.getenv("SUPABASE_URL") and os.getenv("SUPABASE_KEY")
+    else None
+)
+
 
 @app.get("/api/config")
 async def proxy_config():
     """Expose Supabase credentials to MCP clients using the proxy."""
-    supabase_url = os.getenv("SUPABASE_URL", "")
-    supabase_key = os.getenv("SUPABASE_KEY", "")
-    if not supabase_url or not supabase_key:
-        return JSONResponse({"error": "Supabase not configured"}, status_code=404)
-    return JSONResponse({"supabase_url": supabase_url, "supabase_key": supabase_key})
+    if _CONFIG_BODY is None:
+        return _ORJSONResponse({"error": "Supabase not configured"}, status_code=404)
+    return Response(_CONFIG_BODY, media_type="application/json")
+
+
+class ChatMessage(BaseModel):
+    """A single chat message; provider-specific extra fields pass through."""
+
+    model_config = ConfigDict(extra="allow")
+
+    role: Literal["system", "user", "assistant", "tool"]
+    content: str | list[dict[str, Any]] | None = None
+
+
+class ChatRequest(BaseModel):
+    """Body accepted by the /api/chat proxy."""
+
+    model: str = DEFAULT_MODEL
+    messages: list[ChatMessage] = Field(min_length=1, max_length=500)
+    max_tokens: int = Field(DEFAULT_MAX_TOKENS, gt=0, le=32000)
+    temperature: float = Field(DEFAULT_TEMPERATURE, ge=0, le=2)
+    stream: bool = False
+
+
+def _compact_messages(messages: list[ChatMessage]) -> list[ChatMessage]:
+    """Trim trailing whitespace, drop empty messages, and merge same-role runs.
+
+    Only plain-text messages without extra fields (tool_calls, name, ...) are
+    rewritten, so tool and multimodal turns are forwarded untouched.
+    """
+    compacted: list[ChatMessage] = []
+    for message in messages:
+        if message.model_extra or not isinstance(message.content, str | None):
+            compacted.append(message)
+            continue
+        content = (message.content or "").rstrip()
+        if not content:
+            continue
+        prev = compacted[-1] if compacted else None
+        if (
+            prev is not None
+            and prev.role == message.role
+            and not prev.model_extra
+            and isinstance(prev.content, str)
+        ):
+            compacted[-1] = prev.model_copy(update={"content": f"{prev.content}\n{content}"})
+        elif content != message.content:
+            compacted.append(message.model_copy(update={"content": content}))
+        else:
+            compacted.append(message)
+    return compacted
+
+
+_PROXY_CACHE = _TTLCache(PROXY_CACHE_SIZE, PROXY_CACHE_TTL)
+
+
+def _normalize_message_text(text: str) -> str:
+    """Collapse whitespace.
+
+    Not memoised: request bodies are unbounded, and a cache keyed on full
+    message text would pin every large prompt in memory.
+    """
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def _near_duplicate_key(chat: ChatRequest) -> str:
+    """Cache key that ignores only whitespace differences in plain-text message content.
+
+    Case, temperature and every other message field (tool_calls, name, ...)
+    are part of the key, so only requests that mean the same thing share it.
+    """
+    messages = [
+        (
+            m.model_dump(exclude={"content"}),
+            _normalize_message_text(m.content) if isinstance(m.content, str) else m.content,
+        )
+        for m in chat.messages
+    ]
+    blob = orjson.dumps([chat.model, chat.max_tokens, chat.temperature, messages])
+    return "near:" + hashlib.sha256(blob).hexdigest()
+
+
+# Recent request times per client, least recently seen first
+_RATE_WINDOWS: OrderedDict[str, deque[float]] = OrderedDict()
+_RATE_MAX_CLIENTS = 10000
+
+
+def _client_ip(request: Request) -> str:
+    """Client address as recorded by our own proxy.
+
+    Railway's edge appends the connecting address to X-Forwarded-For, so only
+    the rightmost entry is trustworthy; earlier ones are whatever the client sent.
+    """
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _rate_limit_retry_after(client_ip: str) -> float:
+    """Record a request from ``client_ip``; return seconds to wait if over the limit, else 0."""
+    now = time.monotonic()
+    cutoff = now - PROXY_RATE_WINDOW
+    hits = _RATE_WINDOWS.get(client_ip)
+    if hits is None:
+        hits = _RATE_WINDOWS[client_ip] = deque()
+        if len(_RATE_WINDOWS) > _RATE_MAX_CLIENTS:
+            _RATE_WINDOWS.popitem(last=False)
+    else:
+        _RATE_WINDOWS.move_to_end(client_ip)
+    while hits and hits[0] <= cutoff:
+        hits.popleft()
+    if len(hits) >= PROXY_RATE_LIMIT:
+        return hits[0] + PROXY_RATE_WINDOW - now
+    hits.append(now)
+    return 0.0
+
+
+_UPSTREAM_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_UPSTREAM)
+_UPSTREAM_429_RETRIES = 3
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying a 429, preferring the upstream Retry-After."""
+    try:
+        return min(float(response.headers["retry-after"]), 30.0)
+    except (KeyError, ValueError):
+        return 0.5 * 2**attempt + random.uniform(0, 0.5)
+
+
+async def _post_openrouter(body: bytes) -> httpx.Response:
+    """POST a chat completion upstream, backing off and retrying on 429."""
+    client = _get_http_client()
+    for attempt in range(_UPSTREAM_429_RETRIES + 1):
+        async with _UPSTREAM_SEMAPHORE:
+            response = await client.post(OPENROUTER_CHAT_URL, headers=OPENROUTER_HEADERS, content=body)
+        if response.status_code != 429 or attempt == _UPSTREAM_429_RETRIES:
+            return response
+        delay = _retry_delay(response, attempt)
+        logger.warning("OpenRouter rate limited the proxy, retrying in %.1fs", delay)
+        await asyncio.sleep(delay)
+    return response
+
+
+class _UpstreamStreamingResponse(StreamingResponse):
+    """Relays an upstream streaming body and frees its upstream slot when the relay ends.
+
+    Cleanup runs in ``__call__``'s ``finally`` rather than a background task,
+    which Starlette skips when the client disconnects mid-stream.
+    """
+
+    def __init__(self, upstream: httpx.Response) -> None:
+        super().__init__(
+            upstream.aiter_bytes(),
+            status_code=upstream.status_code,
+            media_type=upstream.headers.get("content-type", "text/event-stream"),
+        )
+        self.upstream = upstream
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            _UPSTREAM_SEMAPHORE.release()
+            await self.upstream.aclose()
+
+
+async def _stream_openrouter(body: bytes) -> StreamingResponse:
+    """Relay an OpenRouter completion to the client as the bytes arrive.
+
+    The upstream slot is held until the whole body has been relayed, so long
+    streams count against MAX_CONCURRENT_UPSTREAM for as long as they run.
+    """
+    client = _get_http_client()
+    await _UPSTREAM_SEMAPHORE.acquire()
+    try:
+        upstream = await client.send(
+            client.build_request("POST", OPENROUTER_CHAT_URL, headers=OPENROUTER_HEADERS, content=body),
+            stream=True,
+        )
+    except BaseException:
+        _UPSTREAM_SEMAPHORE.release()
+        raise
+    if upstream.is_error:
+        try:
+            await upstream.aread()
+        finally:
+            _UPSTREAM_SEMAPHORE.release()
+            await upstream.aclose()
+        upstream.raise_for_status()
+    return _UpstreamStreamingResponse(upstream)
+
+
+def _upstream_busy_response() -> JSONResponse:
+    """429 returned instead of queueing when every upstream slot is taken."""
+    return _ORJSONResponse(
+        {"error": "Upstream busy, retry shortly"},
+        status_code=429,
+        headers={"Retry-After": "1"},
+    )
+
+
+# Upstream calls currently in flight, keyed by a digest of the request body
+_INFLIGHT: dict[bytes, asyncio.Task] = {}
+
+
+async def _fetch_completion(body: bytes) -> tuple[bytes, str]:
+    """POST a completion upstream and return its body and content type."""
+    response = await _post_openrouter(body)
+    response.raise_for_status()
+    return response.content, response.headers.get("content-type", "application/json")
+
+
+def _inflight_key(body: bytes) -> bytes:
+    """Digest identifying identical request bodies while their upstream call is running."""
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+async def _coalesced_completion(key: bytes, body: bytes) -> tuple[bytes, str]:
+    """Fetch a completion, sharing one upstream call between identical concurrent requests.
+
+    The upstream call runs as its own task, so a caller disconnecting does
+    not cancel it for the others still waiting.
+    """
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_completion(body))
+        _INFLIGHT[key] = task
+
+        def _forget(done: asyncio.Task) -> None:
+            _INFLIGHT.pop(key, None)
+            if not done.cancelled():
+                done.exception()  # every waiter already receives it; silence the unretrieved warning
+
+        task.add_done_callback(_forget)
+    return await asyncio.shield(task)
 
 
 @app.post("/api/chat")
-async def proxy_chat(request: dict):
+async def proxy_chat(request: Request):
     """Proxy chat completions to OpenRouter (for users without API keys)."""
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        return JSONResponse({"error": "Server configuration error"}, status_code=500)
+    if not OPENROUTER_API_KEY:
+        return _ORJSONResponse({"error": "Server configuration error"}, status_code=500)
+
+    if PROXY_RATE_LIMIT > 0:
+        retry_after = _rate_limit_retry_after(_client_ip(request))
+        if retry_after > 0:
+            return _ORJSONResponse(
+                {"error": "Rate limit exceeded"},
+                status_code=429,
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
     
     # Validate request
-    if not request or "messages" not in request:
-        return JSONResponse({"error": "Invalid request - messages required"}, status_code=400)
-    
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json",
-                    "HTTP-Referer": "https://github.com/baronsilver/symbols-mcp-server",
-                },
-                json={
-                    "model": request.get("model", "openai/gpt-4.1-mini"),
-                    "messages": request["messages"],
-                    "max_tokens": request.get("max_tokens", 4000),
-                    "temperature": request.get("temperature", 0.7),
-                },
-                timeout=60.0,
-            )
-            response.raise_for_status()
-            return JSONResponse(response.json())
+        chat = ChatRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        problems = "; ".join(
+            f"{'.'.join(str(part) for part in err['loc']) or 'body'}: {err['msg']}"
+            for err in e.errors()[:3]
+        )
+        return _ORJSONResponse({"error": f"Invalid request - {problems}"}, status_code=400)
+
+    chat.messages = _compact_messages(chat.messages)
+    if not chat.messages:
+        return _ORJSONResponse({"error": "Invalid request - messages are empty"}, status_code=400)
+
+    # Serialise straight from the validated model; no intermediate dict
+    body = chat.model_dump_json(exclude=None if chat.stream else {"stream"}).encode()
+
+    if chat.stream:
+        if _UPSTREAM_SEMAPHORE.locked():
+            return _upstream_busy_response()
+        try:
+            return await _stream_openrouter(body)
+        except httpx.HTTPError as e:
+            return _ORJSONResponse({"error": str(e)}, status_code=500)
+
+    # Only deterministic requests are safe to answer from the exact cache;
+    # near-duplicates are also served for low-temperature requests.
+    cache_keys = []
+    if chat.temperature == 0:
+        cache_keys.append(hashlib.sha256(body).hexdigest())
+    if chat.temperature <= 0.2:
+        cache_keys.append(_near_duplicate_key(chat))
+    for cache_key in cache_keys:
+        cached = _PROXY_CACHE.get(cache_key)
+        if cached is not None:
+            content, media_type = cached
+            return Response(content, media_type=media_type)
+
+    # Low-temperature answers are shared through the cache anyway, so identical
+    # ones still in flight share a single upstream call too.
+    inflight_key = _inflight_key(body) if cache_keys else None
+    if _UPSTREAM_SEMAPHORE.locked() and inflight_key not in _INFLIGHT:
+        return _upstream_busy_response()
+
+    try:
+        if inflight_key is not None:
+            content, media_type = await _coalesced_completion(inflight_key, body)
+        else:
+            content, media_type = await _fetch_completion(body)
+        # Forward the upstream body verbatim rather than parsing and re-encoding it
+        for cache_key in cache_keys:
+            _PROXY_CACHE.set(cache_key, (content, media_type))
+        return Response(content, media_type=media_type)
     except httpx.HTTPError as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return _ORJSONResponse({"error": str(e)}, status_code=500)
+
+_ROOT_BODY = orjson.dumps({
+    "name": "Symbols MCP Server",
+    "version": "1.0.0",
+    "endpoints": {
+        "health": "/health",
+        "sse": "/sse"
+    }
+})
+
 
-@app.get("/")
-async def root():
+async def root(request: Request) -> Response:
     """Root endpoint - redirect to health."""
-    return JSONResponse({
-        "name": "Symbols MCP Server",
-        "version": "1.0.0",
-        "endpoints": {
-            "health": "/health",
-            "sse": "/sse"
+    return Response(_ROOT_BODY, media_type="application/json")
+
+
+app.add_route("/", root, methods=["GET"], include_in_schema=False)
+
+# The SSE handshake event never changes, so it is encoded once
+_SSE_ENDPOINT_EVENT = {
+    "event": "endpoint",
+    "data": orjson.dumps({
+        "jsonrpc": "2.0",
+        "method": "endpoint",
+        "params": {
+            "uri": "/message"
         }
-    })
+    }).decode()
+}
+
 
 @app.get("/sse")
 async def sse_endpoint():
     """SSE endpoint for MCP HTTP transport."""
-    from sse_starlette.sse import EventSourceResponse
-    
     async def event_generator():
         # Send server info
-        yield {
-            "event": "endpoint",
-            "data": json.dumps({
-                "jsonrpc": "2.0",
-                "method": "endpoint",
-                "params": {
-                    "uri": "/message"
-                }
-            })
-        }
+        yield _SSE_ENDPOINT_EVENT
     
     return EventSourceResponse(event_generator())
 
+# Only the request id varies between /message replies
+_MESSAGE_RESULT = {
+    "server": {
+        "name": "Symbols AI Assistant",
+        "version": "1.0.0"
+    },
+    "capabilities": {
+        "tools": {},
+        "resources": {},
+        "prompts": {}
+    }
+}
+
+_MESSAGE_PREFIX = b'{"jsonrpc":"2.0","id":'
+_MESSAGE_SUFFIX = b',"result":' + orjson.dumps(_MESSAGE_RESULT) + b"}"
+
+
+class JsonRpcRequest(BaseModel):
+    """The part of a JSON-RPC request /message reads; other fields are ignored."""
+
+    id: StrictInt | StrictStr | None = None
+
+
 @app.post("/message")
-async def message_endpoint(request: dict):
+async def message_endpoint(request: JsonRpcRequest):
     """Message endpoint for MCP HTTP transport."""
-    return JSONResponse({
-        "jsonrpc": "2.0",
-        "id": request.get("id"),
-        "result": {
-            "server": {
-                "name": "Symbols AI Assistant",
-                "version": "1.0.0"
-            },
-            "capabilities": {
-                "tools": {},
-                "resources": {},
-                "prompts": {}
-            }
-        }
-    })
+    return Response(
+        b"".join((_MESSAGE_PREFIX, orjson.dumps(request.id), _MESSAGE_SUFFIX)),
+        media_type="application/json",
+    )
 
 # ---------------------------------------------------------------------------
 # Entry point
@@ -1099,12 +1871,27 @@ async def message_endpoint(request: dict):
 def main():
     """Run the Symbols MCP server."""
     # Check if running in Railway (HTTP) or local (stdio)
-    transport = os.getenv("RAILWAY_ENVIRONMENT", "stdio")
-    if transport == "production":
-        # Railway deployment - run FastAPI app directly
-        import uvicorn
-        port = int(os.getenv("PORT", 8080))
-        uvicorn.run(app, host="0.0.0.0", port=port)
+    if IS_RAILWAY:
+        # Railway deployment - run FastAPI app directly. The port and worker
+        # count are read here, not at import, so stdio launches never parse them.
+        port = int(os.getenv("PORT", "8080"))
+        workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+        # Multiple workers need an import string; each worker builds its own
+        # upstream connection pool in the app lifespan, and keeps its own rate
+        # limits, caches and upstream cap (see WEB_CONCURRENCY in the README).
+        uvicorn.run(
+            app if workers == 1 else "symbols_mcp.server:app",
+            host="0.0.0.0",
+            port=port,
+            workers=workers,
+            timeout_keep_alive=75,
+            # uvloop and httptools from uvicorn[standard]; "auto" falls back to
+            # asyncio and h11 where they are not installed (uvloop has no Windows build)
+            loop="auto",
+            http="auto",
+            # Railway probes /health every few seconds; skip a log line per request
+            access_log=False,
+        )
     else:
         # Local development - use stdio transport
         mcp.run(transport="stdio")